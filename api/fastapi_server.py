@@ -1,11 +1,25 @@
-from fastapi import FastAPI, HTTPException
-import json
+from fastapi import FastAPI, HTTPException, Response
 import os
-from typing import Dict, Any, List, Optional
+import hashlib
+import sys
+from typing import Dict, Any, List, Optional, Tuple
 from pydantic import BaseModel
 import logging
 import sqlite3 # Import sqlite3
 
+try:
+    import orjson as _json # Fast C JSON parser when available
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+
+    def _dumps_bytes(obj) -> bytes:
+        return _json.dumps(obj, option=_json.OPT_NON_STR_KEYS)
+except ImportError:
+    import json as _json
+    from fastapi.responses import JSONResponse as DefaultResponse
+
+    def _dumps_bytes(obj) -> bytes:
+        return _json.dumps(obj).encode()
+
 # --- Configure Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -34,84 +48,171 @@ class InsightsOnlyResponse(BaseModel):
     insights: InsightsDetail
 
 # --- FastAPI App Setup ---
-app = FastAPI(title="Earnings Insight API", version="1.0.0")
+# Endpoints return their pre-serialized bodies in a Response, which FastAPI sends as is: no
+# response_model validation and no jsonable_encoder pass. Models are attached via `responses` for
+# the OpenAPI docs only. DefaultResponse (orjson when installed) only applies to handlers that
+# return plain objects, which FastAPI still runs through jsonable_encoder first.
+app = FastAPI(title="Earnings Insight API", version="1.0.0", default_response_class=DefaultResponse)
 
 # --- Database Configuration ---
 DB_PATH = "data/earnings_insights.db"
 CLEANED_TABLE_NAME = "earnings_cleaned_llm"
+RECORD_COLUMNS = "file, ticker, quarter, summary, eps, revenue, guidance, key_risks, ceo_quote"
+
+# Global cache of serialized records (populated from DB): ticker -> year -> quarter -> /company response body
+_data_cache: Dict[str, Dict[int, Dict[str, bytes]]] = {}
+# Precomputed /tickers_quarters response, rebuilt whenever the cache is (re)loaded
+_tickers_quarters_payload: Dict[str, Dict[int, Tuple[str, ...]]] = {}
+_tickers_quarters_bytes: bytes = b"{}"
+# Serialized /summary and /insights bodies of the most recent record per ticker
+_latest_cache: Dict[str, Dict[str, bytes]] = {}
+# Precomputed /bulk/{ticker} responses: ticker -> serialized {quarter_key: record}
+_bulk_bytes: Dict[str, bytes] = {}
+# Fingerprint of the loaded records; sent as X-Data-Version so clients can key their caches on it
+_data_version: str = "0"
+
+def _build_tickers_quarters_payload():
+    """Materializes the sorted ticker -> year -> quarters map (frozen to tuples) and its serialized form."""
+    global _tickers_quarters_payload, _tickers_quarters_bytes
+    _tickers_quarters_payload = {
+        ticker: {year: tuple(sorted(quarters_dict)) for year, quarters_dict in years_dict.items()}
+        for ticker, years_dict in _data_cache.items()
+    }
+    _tickers_quarters_bytes = _dumps_bytes(_tickers_quarters_payload)
+
+def _decode_key_risks(key_risks_json: Optional[str]) -> Any:
+    """Parses the stored key_risks JSON string, treating missing or malformed values as an empty list."""
+    if not key_risks_json:
+        return []
+    try:
+        return _json.loads(key_risks_json)
+    except _json.JSONDecodeError:
+        return [] # Handle malformed JSON
+
+def _insights_from_columns(eps, revenue, guidance, key_risks_json, ceo_quote) -> Dict[str, Any]:
+    """Shapes the insight columns of a row like InsightsDetail."""
+    return {
+        "eps": eps,
+        "revenue": revenue,
+        "guidance": guidance,
+        "key_risks": _decode_key_risks(key_risks_json),
+        "ceo_quote": ceo_quote,
+    }
 
-# Global cache for data (will be populated from DB)
-_data_cache: Dict[str, Dict[int, Dict[str, Any]]] = {} # ticker -> year -> quarter -> record
+def _company_record(row: tuple) -> Dict[str, Any]:
+    """Shapes a row selected with RECORD_COLUMNS like CompanyRecordResponse."""
+    file, ticker, quarter, summary, eps, revenue, guidance, key_risks_json, ceo_quote = row
+    return {
+        "file": file,
+        "ticker": ticker,
+        "quarter": quarter,
+        "summary": summary,
+        "insights": _insights_from_columns(eps, revenue, guidance, key_risks_json, ceo_quote),
+    }
+
+def _build_bulk_payloads():
+    """Stitches each ticker's serialized records into its /bulk body without re-serializing them."""
+    global _bulk_bytes
+    _bulk_bytes = {}
+    for ticker, years_dict in _data_cache.items():
+        # Quarter keys are plain Q<n>_<year> strings, so they need no JSON escaping. Sorted so the
+        # body (and the data version hashed from it) only depends on the records, not on row order.
+        bulk_parts = [
+            b'"%s_%d":%s' % (q.encode(), year, quarters_dict[q])
+            for year, quarters_dict in sorted(years_dict.items())
+            for q in sorted(quarters_dict)
+        ]
+        _bulk_bytes[ticker] = b"{" + b",".join(bulk_parts) + b"}"
+
+def _fingerprint_data() -> str:
+    """Hashes every served response body, so the version only changes when the served data does."""
+    digest = hashlib.blake2b(_tickers_quarters_bytes, digest_size=8)
+    for ticker in sorted(_bulk_bytes):
+        digest.update(_bulk_bytes[ticker])
+    for ticker in sorted(_latest_cache):
+        digest.update(_latest_cache[ticker]["summary"])
+        digest.update(_latest_cache[ticker]["insights"])
+    return digest.hexdigest()
+
+def _parse_qkey(quarter_str: str) -> Tuple[str, int]:
+    """Splits a quarter key like 'Q1_2006' into ('Q1', 2006). Raises ValueError if malformed."""
+    q, _, y = quarter_str.partition("_")
+    if q[:1] != "Q" or not y:
+        raise ValueError(f"Malformed quarter key: {quarter_str!r}")
+    return q, int(y)
 
 # --- Startup Event to Load Data from DB ---
 @app.on_event("startup")
 async def load_data_from_db_on_startup():
-    """Loads data from the SQLite database into memory when the FastAPI application starts."""
-    global _data_cache
+    """
+    Loads all records from the SQLite database into memory when the FastAPI application starts,
+    serializing each response body once so requests never touch the database.
+    """
+    global _data_cache, _latest_cache, _bulk_bytes, _data_version
     _data_cache = {} # Clear previous cache
+    _latest_cache = {}
+    _bulk_bytes = {}
+    _data_version = "0"
+    _build_tickers_quarters_payload() # Invalidate the precomputed payload
 
     if not os.path.exists(DB_PATH):
         logger.warning(f"Database file not found at {DB_PATH}. API will return 404s for all requests.")
         return
 
     conn = None
+    latest_rows: Dict[str, tuple] = {} # ticker -> ((year, quarter number), row) of the most recent record
     try:
         conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row # Return rows as dict-like objects
+        # Bulk-read tuning: map the DB file and give the page cache 64MB
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
         cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM {CLEANED_TABLE_NAME}")
-        records = cursor.fetchall()
-
-        for row in records:
-            record_dict = dict(row) # Convert Row object to dictionary
-            
-            # Parse JSON strings back to Python objects
-            if record_dict.get("key_risks"):
-                try:
-                    record_dict["key_risks"] = json.loads(record_dict["key_risks"])
-                except json.JSONDecodeError:
-                    record_dict["key_risks"] = [] # Handle malformed JSON
-            else:
-                record_dict["key_risks"] = [] # Ensure it's a list if None
-
-            if record_dict.get("raw_insights_json"):
-                try:
-                    record_dict["insights"] = json.loads(record_dict["raw_insights_json"])
-                except json.JSONDecodeError:
-                    record_dict["insights"] = {} # Handle malformed JSON
-            else:
-                record_dict["insights"] = {} # Ensure it's a dict if None
-
-            # Add individual insights fields to the main dict for Pydantic mapping
-            record_dict["insights"]["eps"] = record_dict.get("eps")
-            record_dict["insights"]["revenue"] = record_dict.get("revenue")
-            record_dict["insights"]["guidance"] = record_dict.get("guidance")
-            record_dict["insights"]["ceo_quote"] = record_dict.get("ceo_quote")
-            record_dict["insights"]["key_risks"] = record_dict.get("key_risks") # Use the parsed list
-
-            # Build nested cache: ticker -> year -> quarter -> record
-            ticker = record_dict["ticker"].upper()
-            quarter_str = record_dict["quarter"]
+        cursor.arraysize = 1000
+        # Positional columns, so rows are unpacked without building a dict per record
+        cursor.execute(f"SELECT {RECORD_COLUMNS} FROM {CLEANED_TABLE_NAME}")
+
+        record_count = 0
+        for row in cursor:
+            record_count += 1
+            ticker_raw, quarter_str = row[1], row[2]
+
+            # Build nested cache: ticker -> year -> quarter -> serialized record
+            ticker = ticker_raw.upper()
             try:
-                q, y = quarter_str.split("_")
-                year_int = int(y)
+                q, year_int = _parse_qkey(quarter_str)
+                q = sys.intern(q) # Every record shares one "Q1".."Q4" string object
+                quarter_num = int(q[1:])
             except ValueError:
                 logger.warning(f"Could not parse quarter string: {quarter_str} for ticker {ticker}. Skipping cache entry.")
                 continue
 
-            if ticker not in _data_cache:
-                _data_cache[ticker] = {}
-            if year_int not in _data_cache[ticker]:
-                _data_cache[ticker][year_int] = {}
-            _data_cache[ticker][year_int][q] = record_dict # Store the full dict
+            _data_cache.setdefault(ticker, {}).setdefault(year_int, {})[q] = _dumps_bytes(_company_record(row))
 
-        logger.info(f"Successfully loaded {len(records)} records from {DB_PATH} into memory.")
+            sort_key = (year_int, quarter_num)
+            if ticker not in latest_rows or sort_key >= latest_rows[ticker][0]:
+                latest_rows[ticker] = (sort_key, row)
+
+        for ticker, (_, row) in latest_rows.items():
+            record = _company_record(row)
+            _latest_cache[ticker] = {
+                "summary": _dumps_bytes({"ticker": record["ticker"], "summary": record["summary"]}),
+                "insights": _dumps_bytes({"ticker": record["ticker"], "insights": record["insights"]}),
+            }
+
+        _build_tickers_quarters_payload()
+        _build_bulk_payloads()
+        _data_version = _fingerprint_data()
+        logger.info(f"Successfully loaded {record_count} records from {DB_PATH}.")
     except sqlite3.Error as e:
         logger.critical(f"A critical SQLite error occurred during data loading: {e}", exc_info=True)
         _data_cache = {}
+        _latest_cache = {}
+        _bulk_bytes = {}
     except Exception as e:
         logger.critical(f"An unexpected critical error occurred during data loading: {e}", exc_info=True)
         _data_cache = {}
+        _latest_cache = {}
+        _bulk_bytes = {}
     finally:
         if conn:
             conn.close()
@@ -126,59 +227,60 @@ def get_all_tickers_and_quarters():
     """
     if not _data_cache:
         logger.warning("Attempted to get tickers, but data cache is empty.")
-        return {}
+    else:
+        logger.info(f"Returning {len(_tickers_quarters_payload)} tickers to client for dropdowns.")
 
-    # _data_cache is already in the desired ticker -> year -> quarter structure
-    # We just need to convert sets to lists for JSON serialization and sort them
-    output = {}
-    for ticker, years_dict in _data_cache.items():
-        output[ticker] = {}
-        for year, quarters_dict in years_dict.items():
-            output[ticker][year] = sorted(list(quarters_dict.keys())) # Get quarter keys and sort
+    # Payload is built once per cache load (b"{}" when empty); serve the already-serialized bytes
+    return Response(
+        content=_tickers_quarters_bytes,
+        media_type="application/json",
+        headers={"X-Data-Version": _data_version}
+    )
 
-    logger.info(f"Returning {len(output)} tickers to client for dropdowns.")
-    return output
+@app.get("/bulk/{ticker}", responses={200: {"model": Dict[str, CompanyRecordResponse]}})
+def get_ticker_bundle(ticker: str):
+    """
+    Returns every record for a ticker keyed by quarter_key (e.g. Q1_2006),
+    so clients can fetch a company once and switch quarters locally.
+    """
+    logger.info(f"Received request for bulk records of ticker: {ticker}")
+    ticker_data = _data_cache.get(ticker.upper())
+    if not ticker_data:
+        logger.warning(f"Bulk records for ticker '{ticker}' not found.")
+        raise HTTPException(status_code=404, detail=f"Records for ticker '{ticker}' not found.")
+
+    return Response(content=_bulk_bytes[ticker.upper()], media_type="application/json")
 
 # --- API Endpoints ---
-@app.get("/summary/{ticker}", response_model=SummaryResponse)
+@app.get("/summary/{ticker}", responses={200: {"model": SummaryResponse}})
 def get_summary(ticker: str):
     """
     Retrieves the summary for a given company ticker.
     This endpoint will return the summary for the most recent quarter available for the ticker.
     """
     logger.info(f"Received request for summary of ticker: {ticker}")
-    ticker_data = _data_cache.get(ticker.upper())
-    if not ticker_data:
+    latest = _latest_cache.get(ticker.upper()) # Most recent quarter, resolved at load time
+    if not latest:
         logger.warning(f"Summary for ticker '{ticker}' not found.")
         raise HTTPException(status_code=404, detail=f"Summary for ticker '{ticker}' not found.")
 
-    # Find the most recent quarter for the given ticker
-    latest_year = max(ticker_data.keys())
-    latest_quarter_key = sorted(ticker_data[latest_year].keys(), key=lambda q: int(q[1:]), reverse=True)[0]
-    item = ticker_data[latest_year][latest_quarter_key]
-
-    return SummaryResponse(ticker=item["ticker"], summary=item["summary"])
+    return Response(content=latest["summary"], media_type="application/json")
 
-@app.get("/insights/{ticker}", response_model=InsightsOnlyResponse)
+@app.get("/insights/{ticker}", responses={200: {"model": InsightsOnlyResponse}})
 def get_insights(ticker: str):
     """
     Retrieves the extracted insights for a given company ticker.
     This endpoint will return the insights for the most recent quarter available for the ticker.
     """
     logger.info(f"Received request for insights of ticker: {ticker}")
-    ticker_data = _data_cache.get(ticker.upper())
-    if not ticker_data:
+    latest = _latest_cache.get(ticker.upper()) # Most recent quarter, resolved at load time
+    if not latest:
         logger.warning(f"Insights for ticker '{ticker}' not found.")
         raise HTTPException(status_code=404, detail=f"Insights for ticker '{ticker}' not found.")
 
-    # Find the most recent quarter for the given ticker
-    latest_year = max(ticker_data.keys())
-    latest_quarter_key = sorted(ticker_data[latest_year].keys(), key=lambda q: int(q[1:]), reverse=True)[0]
-    item = ticker_data[latest_year][latest_quarter_key]
-
-    return InsightsOnlyResponse(ticker=item["ticker"], insights=InsightsDetail(**item["insights"]))
+    return Response(content=latest["insights"], media_type="application/json")
 
-@app.get("/company/{ticker}/{quarter_key}", response_model=CompanyRecordResponse)
+@app.get("/company/{ticker}/{quarter_key}", responses={200: {"model": CompanyRecordResponse}})
 def get_full_record(ticker: str, quarter_key: str):
     """
     Retrieves the full record (summary and insights) for a given company ticker and quarter.
@@ -191,18 +293,14 @@ def get_full_record(ticker: str, quarter_key: str):
         raise HTTPException(status_code=404, detail=f"Full record for ticker '{ticker}' not found.")
 
     try:
-        q, y = quarter_key.split("_")
-        year_int = int(y)
+        q, year_int = _parse_qkey(quarter_key)
     except ValueError:
         logger.error(f"Invalid quarter_key format: {quarter_key}")
         raise HTTPException(status_code=400, detail="Invalid quarter_key format. Expected QX_YYYY (e.g., Q1_2006).")
 
-    if year_int in ticker_data and q in ticker_data[year_int]:
-        item = ticker_data[year_int][q]
-        # Ensure the insights sub-object is correctly mapped to InsightsDetail
-        item_copy = item.copy() # Avoid modifying cached object directly
-        item_copy["insights"] = InsightsDetail(**item_copy["insights"])
-        return CompanyRecordResponse(**item_copy)
+    record_bytes = ticker_data.get(year_int, {}).get(q)
+    if record_bytes is not None:
+        return Response(content=record_bytes, media_type="application/json")
     else:
         logger.warning(f"Record for ticker '{ticker}', quarter '{quarter_key}' not found.")
         raise HTTPException(status_code=404, detail=f"Record for ticker '{ticker}', quarter '{quarter_key}' not found.")
\ No newline at end of file
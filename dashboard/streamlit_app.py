@@ -1,6 +1,5 @@
 import streamlit as st
 import requests
-import pandas as pd
 import os
 import logging
 
@@ -13,25 +12,28 @@ FASTAPI_URL = os.getenv("FASTAPI_URL", "http://localhost:8000")
 
 # --- Helper to parse quarter string ---
 def parse_quarter(quarter_str):
+    q, _, y = quarter_str.partition("_")
     try:
-        q, y = quarter_str.split("_")
+        if q[:1] != "Q" or not y:
+            raise ValueError(quarter_str)
         return q, int(y)
-    except:
+    except ValueError:
         logger.warning(f"Could not parse quarter string: {quarter_str}")
         return "QX", 0 # Fallback values
 
 # --- Load initial data (ticker list and quarter map) from FastAPI ---
-@st.cache_data
+@st.cache_data(ttl=300) # Short TTL so a reloaded API (new data version) is noticed
 def load_ticker_quarter_map_from_api():
     """
     Loads all available tickers, years, and quarters from the FastAPI server
-    to populate dropdowns.
+    to populate dropdowns. Returns (ticker_quarter_map, data_version).
     """
     try:
         logger.info(f"Fetching ticker/quarter map from FastAPI at {FASTAPI_URL}/tickers_quarters")
         response = requests.get(f"{FASTAPI_URL}/tickers_quarters")
         response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-        return response.json() # Returns a dict like {ticker: {year: [q1, q2]}}
+        # Map is a dict like {ticker: {year: [q1, q2]}}; the version changes whenever the API reloads new data
+        return response.json(), response.headers.get("X-Data-Version", "0")
     except requests.exceptions.ConnectionError:
         logger.error(f"Could not connect to FastAPI server at {FASTAPI_URL}. Is it running?")
         st.error(f"Error: Could not connect to the API server at {FASTAPI_URL}. Please ensure it is running.")
@@ -45,33 +47,48 @@ def load_ticker_quarter_map_from_api():
         st.error(f"An unexpected error occurred: {e}")
         st.stop()
 
-# --- Helper to fetch a single record from FastAPI ---
-@st.cache_data
-def get_company_record_from_api(ticker: str, quarter_key: str):
-    """Fetches a single company's full record for a specific quarter from the FastAPI server."""
+# --- Helper to fetch all records for a ticker from FastAPI ---
+@st.cache_data(ttl=3600)
+def get_ticker_bundle_from_api(ticker: str, data_version: str):
+    """
+    Fetches every quarter's record for a ticker in one request.
+    data_version is part of the cache key only, so bundles are refetched when the API's data changes.
+    Returns a dict like {quarter_key: record}, or None if the ticker could not be loaded.
+    """
     try:
-        logger.info(f"Fetching full record for {ticker} - {quarter_key} from FastAPI.")
-        response = requests.get(f"{FASTAPI_URL}/company/{ticker}/{quarter_key}")
+        logger.info(f"Fetching all records for {ticker} from FastAPI.")
+        response = requests.get(f"{FASTAPI_URL}/bulk/{ticker}")
         response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
         return response.json()
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 404:
-            logger.warning(f"No record found for {ticker} - {quarter_key} on the API (404).")
-            st.warning(f"No record found for {ticker} - {quarter_key} on the API.")
+            logger.warning(f"No records found for {ticker} on the API (404).")
+            st.warning(f"No records found for {ticker} on the API.")
             return None
-        logger.error(f"HTTP error fetching data for {ticker} - {quarter_key}: {e}")
-        st.error(f"Error fetching data for {ticker} - {quarter_key}: {e}")
+        logger.error(f"HTTP error fetching data for {ticker}: {e}")
+        st.error(f"Error fetching data for {ticker}: {e}")
         return None
     except requests.exceptions.RequestException as e:
-        logger.error(f"Network error fetching data for {ticker} - {quarter_key}: {e}", exc_info=True)
-        st.error(f"Network error fetching data for {ticker} - {quarter_key}: {e}")
+        logger.error(f"Network error fetching data for {ticker}: {e}", exc_info=True)
+        st.error(f"Network error fetching data for {ticker}: {e}")
         return None
 
+# --- Helper to look up a single record ---
+def get_company_record(bundle, ticker: str, quarter_key: str):
+    """Returns a company's full record for a specific quarter from its prefetched ticker bundle."""
+    if bundle is None:
+        return None
+    record = bundle.get(quarter_key)
+    if record is None:
+        logger.warning(f"No record found for {ticker} - {quarter_key} on the API.")
+        st.warning(f"No record found for {ticker} - {quarter_key} on the API.")
+    return record
+
 # --- Streamlit UI ---
 st.title("📊 Earnings Call Insight Dashboard")
 
 # Load the ticker-quarter map from FastAPI
-ticker_quarter_map = load_ticker_quarter_map_from_api()
+ticker_quarter_map, data_version = load_ticker_quarter_map_from_api()
 
 if not ticker_quarter_map:
     st.info("No companies or quarters found in data. Please ensure FastAPI is running and data is loaded into the database.")
@@ -81,6 +98,10 @@ if not ticker_quarter_map:
 available_tickers = sorted(ticker_quarter_map.keys())
 selected_ticker = st.selectbox("Select Company", available_tickers)
 
+# Prefetch every quarter for the ticker once; year/quarter changes below are local lookups
+with st.spinner(f"Fetching data for {selected_ticker}..."):
+    ticker_bundle = get_ticker_bundle_from_api(selected_ticker, data_version)
+
 # Filter years based on selected ticker
 years_for_ticker = sorted(list(ticker_quarter_map.get(selected_ticker, {}).keys()))
 if not years_for_ticker:
@@ -95,12 +116,11 @@ if not quarters_for_year:
     st.stop()
 selected_quarter = st.selectbox("Select Quarter", quarters_for_year)
 
-# Construct quarter_key for API call
+# Construct quarter_key for the bundle lookup
 quarter_key = f"{selected_quarter}_{selected_year}"
 
-# Fetch and display data from FastAPI based on selections
-with st.spinner(f"Fetching data for {selected_ticker} ({quarter_key})..."):
-    record_to_display = get_company_record_from_api(selected_ticker, quarter_key)
+# Display the selected record from the prefetched bundle
+record_to_display = get_company_record(ticker_bundle, selected_ticker, quarter_key)
 
 if not record_to_display:
     st.info("Please select a company, year, and quarter to view insights.")
@@ -121,19 +141,15 @@ insights = record_to_display.get("insights", {})
 if not insights:
     st.info("No insights available.")
 else:
-    # Ensure insights are displayed as a DataFrame properly
+    # Render the insights dict as a one-row table directly, without building a DataFrame
     if isinstance(insights, dict):
-        df_insights = pd.DataFrame([insights])
+        st.table({
+            field: [", ".join(map(str, value)) if isinstance(value, list) else value]
+            for field, value in insights.items()
+        })
     else:
-        try:
-            df_insights = pd.DataFrame(insights)
-        except ValueError:
-            st.warning("Insights format not recognized for tabular display.")
-            st.json(insights)
-            df_insights = pd.DataFrame()
-
-    if not df_insights.empty:
-        st.dataframe(df_insights, use_container_width=True)
+        st.warning("Insights format not recognized for tabular display.")
+        st.json(insights)
 
 # Debug or raw view
 with st.expander("🛠 View Raw JSON"):
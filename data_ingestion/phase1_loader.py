@@ -1,42 +1,122 @@
 from datasets import load_dataset
 import os
-import json
+import concurrent.futures
+import sqlite3
 import logging # Import logging
 
+try:
+    import orjson as _json # Fast C JSON encoder when available
+
+    def _dumps_bytes(obj) -> bytes:
+        return _json.dumps(obj)
+except ImportError:
+    import json as _json
+
+    def _dumps_bytes(obj) -> bytes:
+        return _json.dumps(obj).encode()
+
 # --- Configure Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-os.makedirs("data/raw", exist_ok=True)
+# --- Database Configuration ---
+DB_PATH = "data/earnings_insights.db"
+TRANSCRIPTS_TABLE_NAME = "earnings_raw" # Raw transcripts, read directly by phase2_runner
+DB_BATCH_SIZE = 5000 # Rows per executemany call and per transaction
+
+# Per-file JSON export to data/raw is optional; the earnings_raw table is the primary output
+WRITE_RAW_FILES = os.getenv("WRITE_RAW_FILES", "0") == "1"
+WRITE_WORKERS = 8 # Threads overlapping transcript file writes
+MAX_PENDING_WRITES = WRITE_WORKERS * 4 # Backpressure: bound encoded payloads held in memory
+
+def write_file(fpath, payload):
+    """Writes an already-encoded payload to fpath."""
+    with open(fpath, "wb") as f:
+        f.write(payload)
+    return fpath
+
+def init_transcripts_table(conn):
+    """Creates the raw transcripts table and tunes the connection for a batched bulk load."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL") # Committed batches survive a crash
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {TRANSCRIPTS_TABLE_NAME} (
+            file TEXT PRIMARY KEY,
+            ticker TEXT,
+            quarter TEXT,
+            date TEXT,
+            transcript BLOB
+        )
+    ''')
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TRANSCRIPTS_TABLE_NAME}_ticker ON {TRANSCRIPTS_TABLE_NAME}(ticker)")
+    conn.commit()
+
+def save_transcripts_batch(conn, rows):
+    """Inserts and commits a batch of (file, ticker, quarter, date, transcript) rows."""
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO {TRANSCRIPTS_TABLE_NAME} (file, ticker, quarter, date, transcript)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit() # One transaction per batch, so an interrupted load keeps what it has saved
 
 def run():
     logger.info("🔁 Loading dataset from Hugging Face (kurry/sp500_earnings_transcripts)...")
+    conn = None
     try:
         dataset = load_dataset("kurry/sp500_earnings_transcripts", split="train")
         count = 0
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        if WRITE_RAW_FILES:
+            os.makedirs("data/raw", exist_ok=True)
+
+        conn = sqlite3.connect(DB_PATH)
+        init_transcripts_table(conn)
+        db_rows = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+            pending = set()
+            for record in dataset:
+                cleaned = {
+                    "company": record["company_name"],
+                    "ticker": record["symbol"],
+                    "quarter": f"Q{record['quarter']}_{record['year']}",
+                    "date": record["date"],
+                    "transcript": record["content"]
+                }
+
+                # Stage the transcript for the earnings_raw table
+                fname = f"{cleaned['ticker']}_{cleaned['quarter']}.json"
+                db_rows.append((fname, cleaned["ticker"], cleaned["quarter"], cleaned["date"], cleaned["transcript"]))
+                if len(db_rows) >= DB_BATCH_SIZE:
+                    save_transcripts_batch(conn, db_rows)
+                    db_rows = []
+                count += 1
+                if count % 1000 == 0:
+                    logger.info(f"Loaded {count} transcripts into table {TRANSCRIPTS_TABLE_NAME}...")
+
+                if not WRITE_RAW_FILES:
+                    continue
+
+                # Optionally save raw file too (compact JSON, written off the main thread)
+                fpath = os.path.join("data/raw", fname)
+                pending.add(executor.submit(write_file, fpath, _dumps_bytes(cleaned)))
+
+                if len(pending) >= MAX_PENDING_WRITES:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        future.result() # Surface write errors
+
+            for future in concurrent.futures.as_completed(pending):
+                future.result()
 
-        for record in dataset:
-            cleaned = {
-                "company": record["company_name"],
-                "ticker": record["symbol"],
-                "quarter": f"Q{record['quarter']}_{record['year']}",
-                "date": record["date"],
-                "transcript": record["content"]
-            }
-
-            # Save raw file
-            fname = f"{cleaned['ticker']}_{cleaned['quarter']}.json"
-            fpath = os.path.join("data/raw", fname)
-            with open(fpath, "w") as f:
-                json.dump(cleaned, f, indent=2)
-            count += 1
-
-            if count % 100 == 0:
-                logger.info(f"Saved {count} transcripts to {fpath}...")
-
-        logger.info(f"✅ Loaded and saved {count} transcripts to data/raw/")
+        save_transcripts_batch(conn, db_rows)
+        destinations = f"table {TRANSCRIPTS_TABLE_NAME} in {DB_PATH}" + (" and data/raw/" if WRITE_RAW_FILES else "")
+        logger.info(f"✅ Loaded and saved {count} transcripts to {destinations}")
     except Exception as e:
         logger.critical(f"❌ Critical error during dataset loading or saving: {e}", exc_info=True)
+    finally:
+        if conn:
+            conn.close()
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
@@ -7,6 +7,7 @@ TARGET_TICKER="${TARGET_TICKER:-AAPL}" # Default to AAPL if not set
 MAX_WORKERS="${MAX_WORKERS:-2}"       # Default to 2 if not set (adjust as needed)
 DB_PATH="data/earnings_insights.db"
 CLEANED_TABLE_NAME="earnings_cleaned_llm"
+TRANSCRIPTS_TABLE_NAME="earnings_raw"
 FASTAPI_HOST="0.0.0.0" # Listen on all interfaces inside the container
 FASTAPI_PORT="8000"
 
@@ -31,20 +32,23 @@ else
     echo "⬇️ Cleaned LLM outputs in database not found or empty. Running full data pipeline."
 
     echo "Downloading and preparing raw data..."
-    if [ ! -d "data/raw" ] || [ -z "$(ls -A data/raw 2>/dev/null)" ]; then
-        python3 data_ingestion/phase1_loader.py
-    else
+    # Transcripts live in the $TRANSCRIPTS_TABLE_NAME table; data/raw is only present on older installs
+    TRANSCRIPT_COUNT=$(sqlite3 -batch "$DB_PATH" "SELECT COUNT(*) FROM $TRANSCRIPTS_TABLE_NAME WHERE ticker = UPPER('$TARGET_TICKER');" 2>/dev/null || echo 0)
+    if [ "$TRANSCRIPT_COUNT" -gt 0 ]; then
+        echo "✅ ${TARGET_TICKER} transcripts already in table ${TRANSCRIPTS_TABLE_NAME}. Skipping download and extraction."
+    elif [ -d "data/raw" ] && [ -n "$(ls -A data/raw 2>/dev/null)" ]; then
         echo "✅ Raw data already exists in data/raw/. Skipping download."
-    fi
+        echo "Extracting ${TARGET_TICKER} transcripts (phase2_runner.py backfills them into ${TRANSCRIPTS_TABLE_NAME})..."
+        LOWERCASE_TARGET_TICKER=$(echo "$TARGET_TICKER" | tr '[:upper:]' '[:lower:]')
+        RAW_TICKER_DIR="data/raw_${LOWERCASE_TARGET_TICKER}"
 
-    echo "Extracting ${TARGET_TICKER} transcripts..."
-    LOWERCASE_TARGET_TICKER=$(echo "$TARGET_TICKER" | tr '[:upper:]' '[:lower:]')
-    RAW_TICKER_DIR="data/raw_${LOWERCASE_TARGET_TICKER}"
-
-    if [ ! -d "$RAW_TICKER_DIR" ] || [ -z "$(ls -A "$RAW_TICKER_DIR" 2>/dev/null)" ]; then
-        python3 scripts/extract_ticker.py "$TARGET_TICKER"
+        if [ ! -d "$RAW_TICKER_DIR" ] || [ -z "$(ls -A "$RAW_TICKER_DIR" 2>/dev/null)" ]; then
+            python3 scripts/extract_ticker.py "$TARGET_TICKER"
+        else
+            echo "✅ ${TARGET_TICKER} transcripts already extracted to ${RAW_TICKER_DIR}/. Skipping extraction."
+        fi
     else
-        echo "✅ ${TARGET_TICKER} transcripts already extracted to ${RAW_TICKER_DIR}/. Skipping extraction."
+        python3 data_ingestion/phase1_loader.py
     fi
 
     export MAX_WORKERS # Export for phase2_runner.py to use
@@ -1,16 +1,22 @@
 import os
-import json
 import re
 import glob
 from pathlib import Path
 from tqdm import tqdm
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-import concurrent.futures
-import threading
+import asyncio
+import functools
 import logging
 import sqlite3 # Import sqlite3
 import sys # Import sys to get CLI arguments
+import time
+
+try:
+    import orjson as _json # Fast C JSON parser/encoder when available
+except ImportError:
+    import json as _json
 
 # --- Configure Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -20,20 +26,41 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
-# Thread-local storage for OpenAI client
-_thread_local = threading.local()
-
 # --- Database Configuration ---
 DB_PATH = "data/earnings_insights.db"
 RAW_TABLE_NAME = "earnings_raw_llm" # Table for raw LLM outputs
+TRANSCRIPTS_TABLE_NAME = "earnings_raw" # Raw transcripts written by phase1_loader
+TRANSCRIPT_CHAR_LIMIT = 8000 # Characters of each transcript sent to the LLM
+# Paid LLM results are flushed often, so a crash loses at most a few seconds or a handful of rows
+INSERT_BATCH_SIZE = 25 # Rows buffered per transaction when saving results
+INSERT_FLUSH_SECONDS = 5 # Flush a partial batch once its oldest row has waited this long
+INSERT_SQL = f'''
+    INSERT OR REPLACE INTO {RAW_TABLE_NAME} (
+        file, ticker, quarter, summary, eps, revenue, guidance, key_risks, ceo_quote, raw_insights_json
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Regex fallback for non-JSON LLM output: one scan for all scalar fields, one for the risks array
+_FIELD_RE = re.compile(r'"(summary|eps|revenue|guidance|ceo_quote)"\s*:\s*"([^"]+)"')
+_RISKS_RE = re.compile(r'"key_risks"\s*:\s*\[(.*?)\]', re.DOTALL)
 
-# Function to get OpenAI client for current thread
+def _dumps(obj):
+    """Serializes obj to a JSON string with whichever backend was imported."""
+    out = _json.dumps(obj)
+    return out.decode() if isinstance(out, bytes) else out
+
+# Function to get the shared OpenAI client (one pooled HTTP/2 connection set for all tasks)
+@functools.lru_cache(maxsize=1)
 def get_openai_client():
-    if not hasattr(_thread_local, "openai_client"):
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set.")
-        _thread_local.openai_client = OpenAI(api_key=api_key)
-    return _thread_local.openai_client
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable not set.")
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+    )
 
 def init_db():
     """Initializes the SQLite database and creates the raw LLM output table."""
@@ -67,19 +94,107 @@ def get_processed_files_from_db():
     conn.close()
     return processed
 
-SUMMARY_PROMPT_TEMPLATE = '''
-You are a financial analyst assistant. Read the following earnings call transcript and summarize it in 5-7 sentences, highlighting:
+def get_transcripts_from_db(ticker):
+    """
+    Returns (file, record) pairs for a ticker from the transcripts table populated by phase1_loader.
+    Returns an empty list if the table does not exist (e.g. data/raw was produced by an older loader).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        cursor = conn.execute(
+            # Truncate in SQLite so full transcripts never become Python strings
+            f"SELECT file, ticker, quarter, substr(transcript, 1, ?) FROM {TRANSCRIPTS_TABLE_NAME} WHERE ticker = ? ORDER BY file",
+            (TRANSCRIPT_CHAR_LIMIT, ticker)
+        )
+        return [(file, {"ticker": t, "quarter": q, "transcript": transcript}) for file, t, q, transcript in cursor]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+def backfill_transcripts_from_files(file_paths):
+    """
+    Copies extracted transcript JSON files into the transcripts table, creating it if needed, so
+    installs whose data/raw predates the table are migrated on first use. Returns the rows saved.
+    """
+    rows = []
+    for file_path in file_paths:
+        try:
+            with open(file_path, "rb") as f:
+                record = _json.loads(f.read())
+        except Exception as e:
+            logger.error(f"Failed to load {Path(file_path).name} for backfill: {e}", exc_info=True)
+            continue
+        rows.append((
+            Path(file_path).name, record.get("ticker"), record.get("quarter"), record.get("date"),
+            record.get("transcript") or record.get("text")
+        ))
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TRANSCRIPTS_TABLE_NAME} (
+                file TEXT PRIMARY KEY,
+                ticker TEXT,
+                quarter TEXT,
+                date TEXT,
+                transcript BLOB
+            )
+        ''')
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TRANSCRIPTS_TABLE_NAME}_ticker ON {TRANSCRIPTS_TABLE_NAME}(ticker)")
+        conn.executemany(f'''
+            INSERT OR IGNORE INTO {TRANSCRIPTS_TABLE_NAME} (file, ticker, quarter, date, transcript)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    except sqlite3.Error as db_err:
+        conn.rollback()
+        logger.error(f"❌ Database error backfilling table {TRANSCRIPTS_TABLE_NAME}: {db_err}", exc_info=True)
+        return 0
+    finally:
+        conn.close()
+    return len(rows)
+
+def tune_for_bulk_writes(conn):
+    """Applies write-heavy PRAGMAs to a connection used for inserting LLM results."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+
+def save_records_batch(conn, batch):
+    """Writes a batch of record tuples with a single executemany and one commit."""
+    if not batch:
+        return
+    try:
+        conn.executemany(INSERT_SQL, batch)
+        conn.commit()
+    except sqlite3.Error as db_err:
+        conn.rollback()
+        logger.error(f"❌ Database error saving batch of {len(batch)} records: {db_err}", exc_info=True)
+
+INSIGHTS_MODEL = "gpt-4o"
+# All static instructions come before {transcript}, so the prompt prefix is identical across requests.
+# That prefix is only ~200 tokens, which is below OpenAI's ~1024-token minimum for prompt caching, so no
+# cache hits are expected from it. prompt_cache_key only groups requests for routing and starts to help
+# once the prefix passes that minimum.
+PROMPT_CACHE_KEY_PREFIX = "earnings-insights-v1"
+
+def prompt_cache_key(ticker):
+    """Per-model, per-ticker routing key; calls for one ticker share the most prompt content."""
+    return f"{PROMPT_CACHE_KEY_PREFIX}:{INSIGHTS_MODEL}:{(ticker or '').upper()}"
+
+INSIGHTS_PROMPT_TEMPLATE = '''
+You are a financial analyst assistant. Read the following earnings call transcript and return a JSON object with two keys:
+
+"summary": a 5-7 sentence summary of the call, highlighting:
 - Key financial metrics (e.g. EPS, revenue)
 - Forward guidance
 - Major product or strategy updates
 - Sentiment or tone of executives
 
-Transcript:
-{transcript}
-'''
-
-STRUCTURE_PROMPT_TEMPLATE = '''
-Extract the following fields from this earnings call transcript and return them as a JSON object:
+"insights": an object with the following fields extracted from the transcript:
 - eps
 - revenue
 - guidance
@@ -88,70 +203,76 @@ Extract the following fields from this earnings call transcript and return them
 
 Example:
 {{
-  "eps": "2.15",
-  "revenue": "123.9B",
-  "guidance": "Revenue growth expected in Q2",
-  "key_risks": ["foreign exchange volatility", "supply chain issues"],
-  "ceo_quote": "We’re optimistic about the future and focused on innovation."
+  "summary": "Apple reported record revenue driven by iPhone sales...",
+  "insights": {{
+    "eps": "2.15",
+    "revenue": "123.9B",
+    "guidance": "Revenue growth expected in Q2",
+    "key_risks": ["foreign exchange volatility", "supply chain issues"],
+    "ceo_quote": "We’re optimistic about the future and focused on innovation."
+  }}
 }}
 
+Only return a valid JSON object.
+
 Transcript:
 {transcript}
-
-Only return a valid JSON object.
 '''
 
-def process_single_file(file_path):
-    client = get_openai_client()
+async def process_single_file(file_path):
+    """Loads a transcript JSON file and processes it with process_record."""
     file_name = Path(file_path).name
     try:
-        with open(file_path) as f:
-            record = json.load(f)
-            transcript = record.get("text") or record.get("transcript")
+        with open(file_path, "rb") as f: # orjson parses bytes directly, skipping a separate UTF-8 decode pass
+            record = _json.loads(f.read())
+    except Exception as e:
+        logger.error(f"Failed to load {file_name}: {e}", exc_info=True)
+        return {"status": "failed", "file": file_name, "error": str(e)}
+    return await process_record(file_name, record)
+
+async def process_record(file_name, record):
+    """Summarizes one transcript record and extracts its insights with a single LLM call."""
+    client = get_openai_client()
+    try:
+        transcript = record.get("text") or record.get("transcript")
 
         if not transcript:
             logger.warning(f"No transcript text found for {file_name}. Skipping.")
             return {"status": "skipped", "file": file_name, "error": "No transcript text found."}
 
-        truncated_transcript = transcript[:8000]
-
-        summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(transcript=truncated_transcript)
-        summary_resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": summary_prompt}],
-            timeout=60
-        )
-        summary = summary_resp.choices[0].message.content.strip()
+        truncated_transcript = transcript[:TRANSCRIPT_CHAR_LIMIT] # No-op for rows already truncated in SQL
 
-        structure_prompt = STRUCTURE_PROMPT_TEMPLATE.format(transcript=truncated_transcript)
-        structure_resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": structure_prompt}],
+        insights_prompt = INSIGHTS_PROMPT_TEMPLATE.format(transcript=truncated_transcript)
+        insights_resp = await client.chat.completions.create(
+            model=INSIGHTS_MODEL,
+            messages=[{"role": "user", "content": insights_prompt}],
+            response_format={"type": "json_object"}, # JSON mode keeps the regex fallback a rare path
+            extra_body={"prompt_cache_key": prompt_cache_key(record.get("ticker"))}, # Sent raw so older SDK versions accept it
             timeout=60
         )
-        structured_text = structure_resp.choices[0].message.content.strip()
+        structured_text = insights_resp.choices[0].message.content.strip()
 
         structured = {}
         try:
-            structured = json.loads(structured_text)
-        except json.JSONDecodeError:
+            parsed = _json.loads(structured_text)
+            summary, insights = None, None
+            if isinstance(parsed, dict):
+                summary = parsed.get("summary")
+                # Flat replies put the insight fields next to "summary" instead of under "insights"
+                insights = parsed["insights"] if "insights" in parsed else {k: v for k, v in parsed.items() if k != "summary"}
+            structured = insights if isinstance(insights, dict) else {}
+        except _json.JSONDecodeError:
             logger.debug(f"GPT-4o returned unstructured output for {file_name}. Attempting regex fallback...")
             try:
-                eps_match = re.search(r'"eps"\s*:\s*"([^"]+)"', structured_text)
-                revenue_match = re.search(r'"revenue"\s*:\s*"([^"]+)"', structured_text)
-                guidance_match = re.search(r'"guidance"\s*:\s*"([^"]+)"', structured_text)
-                risks_match = re.search(r'"key_risks"\s*:\s*\[(.*?)\]', structured_text, re.DOTALL)
-                quote_match = re.search(r'"ceo_quote"\s*:\s*"([^"]+)"', structured_text)
-
-                if eps_match: structured["eps"] = eps_match.group(1)
-                if revenue_match: structured["revenue"] = revenue_match.group(1)
-                if guidance_match: structured["guidance"] = guidance_match.group(1)
+                for field_match in _FIELD_RE.finditer(structured_text):
+                    structured.setdefault(field_match.group(1), field_match.group(2)) # First occurrence wins
+                summary = structured.pop("summary", None)
+                risks_match = _RISKS_RE.search(structured_text)
                 if risks_match:
                     try:
-                        structured["key_risks"] = json.loads(f'[{risks_match.group(1)}]')
-                    except json.JSONDecodeError:
+                        structured["key_risks"] = _json.loads(f'[{risks_match.group(1)}]')
+                    except _json.JSONDecodeError:
                         structured["key_risks"] = [r.strip('" ') for r in risks_match.group(1).split(",") if r.strip()]
-                if quote_match: structured["ceo_quote"] = quote_match.group(1)
             except Exception as e:
                 logger.error(f"Regex fallback also failed for {file_name}: {e}", exc_info=True)
                 return {"status": "failed", "file": file_name, "error": f"Regex fallback also failed: {e}"}
@@ -159,18 +280,22 @@ def process_single_file(file_path):
             logger.error(f"Unexpected error parsing structured text for {file_name}: {e}", exc_info=True)
             return {"status": "failed", "file": file_name, "error": f"Unexpected error parsing structured text: {e}"}
 
+        if not summary:
+            logger.error(f"GPT-4o response for {file_name} did not include a summary.")
+            return {"status": "failed", "file": file_name, "error": "No summary in LLM response."}
+
         # Prepare record for database insertion
         output_record = {
             "file": file_name,
             "ticker": record.get("ticker", "UNKNOWN_TICKER"),
             "quarter": record.get("quarter", "UNKNOWN_QUARTER"),
-            "summary": summary,
+            "summary": summary.strip(),
             "eps": structured.get("eps"),
             "revenue": structured.get("revenue"),
             "guidance": structured.get("guidance"),
-            "key_risks": json.dumps(structured.get("key_risks")), # Store list as JSON string
+            "key_risks": _dumps(structured.get("key_risks")), # Store list as JSON string
             "ceo_quote": structured.get("ceo_quote"),
-            "raw_insights_json": json.dumps(structured) # Store the full insights dict as JSON string
+            "raw_insights_json": _dumps(structured) # Store the full insights dict as JSON string
         }
 
         return {"status": "success", "record": output_record}
@@ -179,6 +304,59 @@ def process_single_file(file_path):
         logger.error(f"Failed to process {file_name}: {e}", exc_info=True)
         return {"status": "failed", "file": file_name, "error": str(e)}
 
+async def process_all(files_to_process, max_workers):
+    """Processes (file_name, record-or-path) items with at most max_workers in flight, saving results in batches."""
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def process_bounded(file_name, source):
+        async with semaphore:
+            if isinstance(source, dict):
+                return await process_record(file_name, source)
+            return await process_single_file(source)
+
+    tasks = [asyncio.ensure_future(process_bounded(file_name, source)) for file_name, source in files_to_process]
+
+    conn = sqlite3.connect(DB_PATH) # Open connection for writing results
+    tune_for_bulk_writes(conn)
+    batch = [] # Buffered rows, flushed in one transaction per INSERT_BATCH_SIZE or INSERT_FLUSH_SECONDS
+    batch_started = time.monotonic()
+    pending = set(tasks)
+    try:
+        with tqdm(total=len(tasks), desc="Processing Transcripts") as progress:
+            while pending:
+                # Wake up at least every INSERT_FLUSH_SECONDS so a partial batch is saved even while calls are slow
+                done, pending = await asyncio.wait(pending, timeout=INSERT_FLUSH_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    progress.update(1)
+                    if result["status"] == "success":
+                        record_data = result["record"]
+                        if not batch:
+                            batch_started = time.monotonic()
+                        batch.append((
+                            record_data["file"], record_data["ticker"], record_data["quarter"],
+                            record_data["summary"], record_data["eps"], record_data["revenue"],
+                            record_data["guidance"], record_data["key_risks"], record_data["ceo_quote"],
+                            record_data["raw_insights_json"]
+                        ))
+                    elif result["status"] == "skipped":
+                        logger.info(f"Skipped {result['file']}: {result['error']}")
+                    else:
+                        logger.error(f"Processing failed for {result['file']}: {result['error']}")
+
+                if len(batch) >= INSERT_BATCH_SIZE or (batch and time.monotonic() - batch_started >= INSERT_FLUSH_SECONDS):
+                    save_records_batch(conn, batch)
+                    batch = []
+    finally:
+        for task in tasks:
+            task.cancel() # No-op for finished tasks; stops in-flight calls on interruption
+        await asyncio.gather(*tasks, return_exceptions=True) # Let cancelled calls unwind before closing the client
+        save_records_batch(conn, batch) # Flush whatever is left, even on interruption
+        conn.close() # Close connection after all writes
+        if get_openai_client.cache_info().currsize:
+            await get_openai_client().close()
+            get_openai_client.cache_clear()
+
 # --- Main execution with concurrency ---
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -191,10 +369,23 @@ if __name__ == "__main__":
 
     init_db() # Initialize the database and table
 
-    files = sorted(glob.glob(f"{RAW_DIR}/*.json"))
     processed_files_db = get_processed_files_from_db() # Get processed files from DB
 
-    files_to_process = [f for f in files if Path(f).name not in processed_files_db]
+    # Prefer transcripts stored in the DB by phase1_loader; backfill the table from the extracted JSON files if needed
+    db_transcripts = get_transcripts_from_db(TARGET_TICKER)
+    if not db_transcripts:
+        raw_files = sorted(glob.glob(f"{RAW_DIR}/*.json"))
+        if raw_files:
+            backfilled = backfill_transcripts_from_files(raw_files)
+            logger.info(f"Backfilled {backfilled} {TARGET_TICKER} transcripts from {RAW_DIR} into table {TRANSCRIPTS_TABLE_NAME}.")
+            db_transcripts = get_transcripts_from_db(TARGET_TICKER)
+    if db_transcripts:
+        logger.info(f"Reading {TARGET_TICKER} transcripts from table {TRANSCRIPTS_TABLE_NAME}.")
+        files_to_process = [(file, record) for file, record in db_transcripts if file not in processed_files_db]
+    else:
+        logger.info(f"No {TARGET_TICKER} rows in table {TRANSCRIPTS_TABLE_NAME}. Reading transcripts from {RAW_DIR}.")
+        files = sorted(glob.glob(f"{RAW_DIR}/*.json"))
+        files_to_process = [(Path(f).name, f) for f in files if Path(f).name not in processed_files_db]
     logger.info(f"🧹 Skipping {len(processed_files_db)} already-processed transcripts (from DB). Processing {len(files_to_process)} new ones for {TARGET_TICKER}...")
 
     MAX_WORKERS = int(os.getenv("MAX_WORKERS", 2)) # Default to 2 for safety with OpenAI limits
@@ -202,34 +393,7 @@ if __name__ == "__main__":
     if not files_to_process:
         logger.info(f"No new files to process for {TARGET_TICKER}. Exiting.")
     else:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_file = {executor.submit(process_single_file, file_path): file_path for file_path in files_to_process}
-
-            conn = sqlite3.connect(DB_PATH) # Open connection for writing results
-            cursor = conn.cursor()
-            for future in tqdm(concurrent.futures.as_completed(future_to_file), total=len(files_to_process), desc="Processing Transcripts"):
-                result = future.result()
-                if result["status"] == "success":
-                    record_data = result["record"]
-                    try:
-                        cursor.execute(f'''
-                            INSERT OR REPLACE INTO {RAW_TABLE_NAME} (
-                                file, ticker, quarter, summary, eps, revenue, guidance, key_risks, ceo_quote, raw_insights_json
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            record_data["file"], record_data["ticker"], record_data["quarter"],
-                            record_data["summary"], record_data["eps"], record_data["revenue"],
-                            record_data["guidance"], record_data["key_risks"], record_data["ceo_quote"],
-                            record_data["raw_insights_json"]
-                        ))
-                        conn.commit()
-                    except sqlite3.Error as db_err:
-                        logger.error(f"❌ Database error saving {record_data['file']}: {db_err}", exc_info=True)
-                elif result["status"] == "skipped":
-                    logger.info(f"Skipped {result['file']}: {result['error']}")
-                else:
-                    logger.error(f"Processing failed for {result['file']}: {result['error']}")
-            conn.close() # Close connection after all writes
+        asyncio.run(process_all(files_to_process, MAX_WORKERS))
 
     logger.info(f"\n✅ All processing attempts completed for {TARGET_TICKER}.")
     logger.info(f"Results saved to database {DB_PATH} in table {RAW_TABLE_NAME}. Check logs for any errors or warnings.")
\ No newline at end of file
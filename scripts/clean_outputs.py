@@ -1,4 +1,3 @@
-import json
 import logging
 import sqlite3
 import os
@@ -11,6 +10,7 @@ logger = logging.getLogger(__name__)
 DB_PATH = "data/earnings_insights.db"
 RAW_TABLE_NAME = "earnings_raw_llm"
 CLEANED_TABLE_NAME = "earnings_cleaned_llm"
+REJECTED_TABLE_NAME = "earnings_rejected_llm" # Raw rows the filter rejected, so later runs skip them
 
 BAD_PHRASES = [
     "Please provide the content",
@@ -22,16 +22,56 @@ BAD_PHRASES = [
     "I do not have access to real-time",
 ]
 
-def is_valid(record):
-    summary = record.get("summary", "").lower()
-    if any(phrase.lower() in summary for phrase in BAD_PHRASES):
-        return False
-    return True
+# The whole clean pass is two statements over the raw rows not cleaned or rejected yet. Rows whose
+# summary contains a BAD_PHRASE (or is NULL) are recorded as rejected. Every other row is copied, and
+# key_risks / raw_insights_json that are malformed or not a JSON array / object become empty JSON values.
+# The rejection marker keeps the summary it rejected, so a raw row regenerated with a new summary is
+# checked again.
+PENDING_ROWS_SQL = f'''
+    FROM {RAW_TABLE_NAME} r
+    LEFT JOIN {CLEANED_TABLE_NAME} c ON r.file = c.file
+    LEFT JOIN {REJECTED_TABLE_NAME} x ON r.file = x.file AND r.summary IS x.summary
+    WHERE c.file IS NULL AND x.file IS NULL
+'''
+# PY_LOWER is str.lower registered on the connection. SQLite's LOWER() folds ASCII letters only, so it
+# would not match the Unicode lowercasing the Python filter did.
+BAD_PHRASES_SQL = "(" + " AND ".join(["INSTR(PY_LOWER(r.summary), ?) = 0"] * len(BAD_PHRASES)) + ")"
+BAD_PHRASES_PARAMS = [phrase.lower() for phrase in BAD_PHRASES]
+# json_type() errors on malformed JSON, so json_valid() is checked in an earlier WHEN
+INSERT_SQL = f'''
+    INSERT OR REPLACE INTO {CLEANED_TABLE_NAME} (
+        file, ticker, quarter, summary, eps, revenue, guidance, key_risks, ceo_quote, raw_insights_json
+    )
+    SELECT
+        r.file, r.ticker, r.quarter, r.summary, r.eps, r.revenue, r.guidance,
+        CASE WHEN NOT json_valid(r.key_risks) THEN '[]' WHEN json_type(r.key_risks) = 'array' THEN r.key_risks ELSE '[]' END,
+        r.ceo_quote,
+        CASE WHEN NOT json_valid(r.raw_insights_json) THEN '{{}}' WHEN json_type(r.raw_insights_json) = 'object' THEN r.raw_insights_json ELSE '{{}}' END
+    {PENDING_ROWS_SQL} AND {BAD_PHRASES_SQL}
+'''
+REJECT_SQL = f'''
+    INSERT OR REPLACE INTO {REJECTED_TABLE_NAME} (file, summary)
+    SELECT r.file, r.summary
+    {PENDING_ROWS_SQL} AND NOT COALESCE({BAD_PHRASES_SQL}, 0)
+'''
+
+def _py_lower(value):
+    """str.lower for SQLite text values; NULL and non-text values pass through unchanged."""
+    return value.lower() if isinstance(value, str) else value
+
+def tune(conn):
+    """Applies the connection PRAGMAs used by this script: WAL journaling, relaxed fsyncs and a larger cache."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000") # ~64MB page cache
+    conn.execute("PRAGMA busy_timeout=5000") # Wait up to 5s for locks held by other processes
 
 def init_cleaned_db_table():
-    """Initializes the SQLite database and creates the cleaned LLM output table."""
+    """Initializes the SQLite database and creates the cleaned LLM output and rejection tables."""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
+    tune(conn)
     cursor = conn.cursor()
     cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS {CLEANED_TABLE_NAME} (
@@ -48,79 +88,50 @@ def init_cleaned_db_table():
             cleaned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {REJECTED_TABLE_NAME} (
+            file TEXT PRIMARY KEY,
+            summary TEXT, -- The rejected summary; a different summary for this file is checked again
+            rejected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
     conn.commit()
     conn.close()
-    logger.info(f"Database {DB_PATH} and table {CLEANED_TABLE_NAME} initialized.")
+    logger.info(f"Database {DB_PATH} and tables {CLEANED_TABLE_NAME}, {REJECTED_TABLE_NAME} initialized.")
 
 logger.info(f"Starting cleaning process. Reading from {RAW_TABLE_NAME} and writing to {CLEANED_TABLE_NAME} in {DB_PATH}.")
 
 if __name__ == "__main__":
     init_cleaned_db_table()
 
-    conn_raw = None
-    conn_cleaned = None
+    conn = None
+    saved_count = 0
+    rejected_count = 0
     try:
-        conn_raw = sqlite3.connect(DB_PATH)
-        cursor_raw = conn_raw.cursor()
-
-        conn_cleaned = sqlite3.connect(DB_PATH)
-        cursor_cleaned = conn_cleaned.cursor()
-
-        # Select all records from the raw table that haven't been cleaned yet (or re-clean all)
-        # For simplicity, we'll re-clean all records from raw table and replace in cleaned table
-        cursor_raw.execute(f"SELECT * FROM {RAW_TABLE_NAME}")
-        raw_records = cursor_raw.fetchall()
-
-        cleaned_count = 0
-        processed_count = 0
-
-        # Get column names from cursor description
-        col_names = [description[0] for description in cursor_raw.description]
-
-        for row in raw_records:
-            processed_count += 1
-            record_dict = dict(zip(col_names, row))
-
-            # Convert key_risks and raw_insights_json back to Python objects for validation
-            # and then re-serialize for cleaned table if needed
-            if record_dict.get("key_risks"):
-                try:
-                    record_dict["key_risks"] = json.loads(record_dict["key_risks"])
-                except json.JSONDecodeError:
-                    record_dict["key_risks"] = [] # Default to empty list if malformed
-            if record_dict.get("raw_insights_json"):
-                try:
-                    record_dict["raw_insights_json"] = json.loads(record_dict["raw_insights_json"])
-                except json.JSONDecodeError:
-                    record_dict["raw_insights_json"] = {} # Default to empty dict if malformed
-
-            if is_valid(record_dict):
-                try:
-                    cursor_cleaned.execute(f'''
-                        INSERT OR REPLACE INTO {CLEANED_TABLE_NAME} (
-                            file, ticker, quarter, summary, eps, revenue, guidance, key_risks, ceo_quote, raw_insights_json
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        record_dict["file"], record_dict["ticker"], record_dict["quarter"],
-                        record_dict["summary"], record_dict["eps"], record_dict["revenue"],
-                        record_dict["guidance"], json.dumps(record_dict["key_risks"]), # Re-serialize
-                        record_dict["ceo_quote"], json.dumps(record_dict["raw_insights_json"]) # Re-serialize
-                    ))
-                    conn_cleaned.commit()
-                except sqlite3.Error as db_err:
-                    logger.error(f"❌ Database error saving cleaned record {record_dict['file']}: {db_err}", exc_info=True)
-            else:
-                cleaned_count += 1
-                logger.warning(f"Cleaned (skipped) entry {record_dict.get('file')} due to invalid summary content.")
+        # One connection serves all three tables, and both statements commit as one transaction
+        conn = sqlite3.connect(DB_PATH)
+        tune(conn)
+        conn.create_function("PY_LOWER", 1, _py_lower, deterministic=True)
+        cursor = conn.cursor()
+
+        # Only raw records neither cleaned nor rejected yet are processed, so re-runs are incremental.
+        # Saved rows leave the pending set before REJECT_SQL runs, so it only sees the rows the filter rejects.
+        cursor.execute(INSERT_SQL, BAD_PHRASES_PARAMS)
+        saved_count = cursor.rowcount
+        cursor.execute(REJECT_SQL, BAD_PHRASES_PARAMS)
+        rejected_count = cursor.rowcount
+        conn.commit()
 
     except sqlite3.Error as e:
+        if conn:
+            conn.rollback()
         logger.critical(f"A critical SQLite error occurred during cleaning: {e}", exc_info=True)
     except Exception as e:
+        if conn:
+            conn.rollback()
         logger.critical(f"A critical unexpected error occurred during cleaning: {e}", exc_info=True)
     finally:
-        if conn_raw:
-            conn_raw.close()
-        if conn_cleaned:
-            conn_cleaned.close()
+        if conn:
+            conn.close()
 
-    logger.info(f"✅ Finished cleaning. Processed {processed_count} entries. Cleaned (skipped/filtered) {cleaned_count} bad entries.")
\ No newline at end of file
+    logger.info(f"✅ Finished cleaning. Saved {saved_count} new entries. Rejected {rejected_count} new entries with invalid summary content.")
\ No newline at end of file
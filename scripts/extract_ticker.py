@@ -1,6 +1,6 @@
 import os
 import shutil
-import glob
+import concurrent.futures
 import sys # Import sys to access command-line arguments
 import logging
 
@@ -10,6 +10,20 @@ logger = logging.getLogger(__name__)
 
 SOURCE_DIR = "data/raw"
 DEST_DIR_PREFIX = "data/raw_" # Prefix for dynamic destination directory
+COPY_WORKERS = min(16, (os.cpu_count() or 1) * 2) # Threads overlapping per-file copy syscalls
+
+def fast_copy(src: str, dst: str):
+    """
+    Hard-links src to dst so no file data is copied, falling back to a regular copy
+    when linking is not possible (e.g. across filesystems).
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        if not os.path.samefile(src, dst): # Already linked by a previous run
+            shutil.copyfile(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst) # In-kernel copy (sendfile) on Linux; permission bits are not needed
 
 def run_extraction(ticker: str):
     """
@@ -22,8 +36,13 @@ def run_extraction(ticker: str):
     DEST_DIR = f"{DEST_DIR_PREFIX}{ticker.lower()}" # e.g., data/raw_aapl
     os.makedirs(DEST_DIR, exist_ok=True)
 
-    # Use a pattern that matches the specific ticker
-    ticker_files = glob.glob(f"{SOURCE_DIR}/{ticker.upper()}_*.json")
+    # Files for the specific ticker: one directory scan with plain prefix/suffix tests
+    prefix = f"{ticker.upper()}_"
+    try:
+        with os.scandir(SOURCE_DIR) as it:
+            ticker_files = [entry for entry in it if entry.name.startswith(prefix) and entry.name.endswith(".json")]
+    except FileNotFoundError:
+        ticker_files = []
 
     logger.info(f"Starting extraction for {ticker.upper()}. Found {len(ticker_files)} files in {SOURCE_DIR}.")
 
@@ -31,15 +50,19 @@ def run_extraction(ticker: str):
         logger.warning(f"No {ticker.upper()} files found in {SOURCE_DIR}. Ensure phase1_loader.py has run.")
         return # Exit gracefully if no files found
 
+    dest_prefix = DEST_DIR + os.sep
     copied_count = 0
-    for f in ticker_files:
-        dest = os.path.join(DEST_DIR, os.path.basename(f))
-        try:
-            shutil.copy(f, dest)
-            copied_count += 1
-            logger.info(f"✅ Copied: {os.path.basename(f)} to {DEST_DIR}")
-        except Exception as e:
-            logger.error(f"❌ Failed to copy {os.path.basename(f)}: {e}", exc_info=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        futures = {executor.submit(fast_copy, entry.path, dest_prefix + entry.name): entry.name for entry in ticker_files}
+        for future in concurrent.futures.as_completed(futures):
+            fname = futures[future]
+            try:
+                future.result()
+                copied_count += 1
+                if logger.isEnabledFor(logging.DEBUG): # Per-file lines only when debugging; the summary below reports the count
+                    logger.debug("Copied %s to %s", fname, DEST_DIR)
+            except Exception as e:
+                logger.error(f"❌ Failed to copy {fname}: {e}", exc_info=True)
 
     logger.info(f"✅ All {copied_count} {ticker.upper()} transcripts extraction attempt completed to {DEST_DIR}.")
 
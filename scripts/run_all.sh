@@ -38,6 +38,7 @@ echo "Targeting ticker: $TARGET_TICKER for processing."
 # --- Database Configuration ---
 DB_PATH="data/earnings_insights.db"
 CLEANED_TABLE_NAME="earnings_cleaned_llm"
+TRANSCRIPTS_TABLE_NAME="earnings_raw"
 
 # --- Conditional Data Processing Steps ---
 # Check if the cleaned data table in the database has any records
@@ -56,23 +57,26 @@ else
     echo "⬇️ Cleaned LLM outputs in database not found or or empty. Running full data pipeline."
 
     echo "Downloading and preparing raw data..."
-    if [ ! -d "data/raw" ] || [ -z "$(ls -A data/raw)" ]; then
-        python3 data_ingestion/phase1_loader.py
-        if [ $? -ne 0 ]; then echo "❌ data_ingestion/phase1_loader.py failed."; deactivate; exit 1; fi
-    else
+    # Transcripts live in the $TRANSCRIPTS_TABLE_NAME table; data/raw is only present on older installs
+    TRANSCRIPT_COUNT=$(sqlite3 -batch "$DB_PATH" "SELECT COUNT(*) FROM $TRANSCRIPTS_TABLE_NAME WHERE ticker = UPPER('$TARGET_TICKER');" 2>/dev/null || echo 0)
+    if [ "$TRANSCRIPT_COUNT" -gt 0 ]; then
+        echo "✅ ${TARGET_TICKER} transcripts already in table ${TRANSCRIPTS_TABLE_NAME}. Skipping download and extraction."
+    elif [ -d "data/raw" ] && [ -n "$(ls -A data/raw)" ]; then
         echo "✅ Raw data already exists in data/raw/. Skipping download."
-    fi
-
-    echo "Extracting ${TARGET_TICKER} transcripts..."
-    # FIX: Use tr for robust lowercase conversion
-    LOWERCASE_TARGET_TICKER=$(echo "$TARGET_TICKER" | tr '[:upper:]' '[:lower:]')
-    RAW_TICKER_DIR="data/raw_${LOWERCASE_TARGET_TICKER}"
-
-    if [ ! -d "$RAW_TICKER_DIR" ] || [ -z "$(ls -A "$RAW_TICKER_DIR")" ]; then
-        python3 scripts/extract_ticker.py "$TARGET_TICKER" # Pass ticker as argument
-        if [ $? -ne 0 ]; then echo "❌ scripts/extract_ticker.py failed."; deactivate; exit 1; fi
+        echo "Extracting ${TARGET_TICKER} transcripts (phase2_runner.py backfills them into ${TRANSCRIPTS_TABLE_NAME})..."
+        # FIX: Use tr for robust lowercase conversion
+        LOWERCASE_TARGET_TICKER=$(echo "$TARGET_TICKER" | tr '[:upper:]' '[:lower:]')
+        RAW_TICKER_DIR="data/raw_${LOWERCASE_TARGET_TICKER}"
+
+        if [ ! -d "$RAW_TICKER_DIR" ] || [ -z "$(ls -A "$RAW_TICKER_DIR")" ]; then
+            python3 scripts/extract_ticker.py "$TARGET_TICKER" # Pass ticker as argument
+            if [ $? -ne 0 ]; then echo "❌ scripts/extract_ticker.py failed."; deactivate; exit 1; fi
+        else
+            echo "✅ ${TARGET_TICKER} transcripts already extracted to ${RAW_TICKER_DIR}/. Skipping extraction."
+        fi
     else
-        echo "✅ ${TARGET_TICKER} transcripts already extracted to ${RAW_TICKER_DIR}/. Skipping extraction."
+        python3 data_ingestion/phase1_loader.py
+        if [ $? -ne 0 ]; then echo "❌ data_ingestion/phase1_loader.py failed."; deactivate; exit 1; fi
     fi
 
     export MAX_WORKERS=1
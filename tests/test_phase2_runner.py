@@ -0,0 +1,65 @@
+import asyncio
+import importlib.util
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+for _dependency in ("openai", "httpx", "tqdm", "dotenv"):
+    pytest.importorskip(_dependency)
+
+_spec = importlib.util.spec_from_file_location(
+    "phase2_runner", Path(__file__).resolve().parent.parent / "llm_processor" / "phase2_runner.py"
+)
+phase2_runner = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(phase2_runner)
+
+RECORD = {"ticker": "AAPL", "quarter": "Q1_2006", "transcript": "Revenue grew."}
+INSIGHTS = {
+    "eps": "2.15",
+    "revenue": "123.9B",
+    "guidance": "Growth expected",
+    "key_risks": ["fx", "supply chain"],
+    "ceo_quote": "We are optimistic.",
+}
+
+
+def _fake_client(reply):
+    async def create(**kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _process(monkeypatch, reply):
+    monkeypatch.setattr(phase2_runner, "get_openai_client", lambda: _fake_client(reply))
+    return asyncio.run(phase2_runner.process_record("AAPL_Q1_2006.json", RECORD))
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        {"summary": "Strong quarter.", "insights": INSIGHTS},
+        {"summary": "Strong quarter.", **INSIGHTS},  # Flat: insight fields at the top level
+    ],
+    ids=["nested", "flat"],
+)
+def test_process_record_extracts_insights(monkeypatch, reply):
+    result = _process(monkeypatch, json.dumps(reply))
+
+    assert result["status"] == "success"
+    record = result["record"]
+    assert record["summary"] == "Strong quarter."
+    assert record["eps"] == "2.15"
+    assert record["revenue"] == "123.9B"
+    assert record["guidance"] == "Growth expected"
+    assert json.loads(record["key_risks"]) == ["fx", "supply chain"]
+    assert record["ceo_quote"] == "We are optimistic."
+    assert json.loads(record["raw_insights_json"]) == INSIGHTS
+
+
+def test_process_record_fails_without_summary(monkeypatch):
+    result = _process(monkeypatch, json.dumps(INSIGHTS))
+
+    assert result["status"] == "failed"